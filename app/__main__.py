@@ -1,25 +1,54 @@
 import logging
+import signal
+import stat
 import threading
 import time
+from contextlib import asynccontextmanager
+from pathlib import Path
 
 from config import settings
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from image_cache import CachedStaticFiles, ImageCache, file_version, image_response
 from observers import start_observer
 
 logger = logging.getLogger()
 
+# Dictionary to store image handlers and their respective observers
+image_handlers = {}
+observers = {}
+
+
+def stop_all_observers():
+    for observer in observers.values():
+        observer.stop()
+    for observer in observers.values():
+        observer.join()
+
+    # Close the time-lapse videos being written, so that they are playable
+    for handler in image_handlers.values():
+        if handler.timelapse:
+            handler.timelapse.stop()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await run_in_threadpool(stop_all_observers)
+
+
 # FastAPI app setup
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Setup Jinja2 templates
 templates = Jinja2Templates(directory="templates")
 
-# Dictionary to store image handlers and their respective observers
-image_handlers = {}
-observers = {}
+# In-memory LRU cache of the most recently served images
+image_cache = ImageCache(
+    max_bytes=int(settings.dashboard.get("image_cache_mb", 64) * 1024**2)
+)
 
 
 # Function to start all observers based on the configuration
@@ -38,7 +67,7 @@ def start_all_observers():
         route_name = f"resized-images-{i}"
         app.mount(
             f"/{route_name}",
-            StaticFiles(directory=str(directory_config.output)),
+            CachedStaticFiles(directory=str(directory_config.output)),
             name=route_name,
         )
 
@@ -59,33 +88,58 @@ def read_root():
 
 
 @app.get("/images/{dir_id}/{image_name}")
-async def get_image(dir_id: str, image_name: str):
+async def get_image(request: Request, dir_id: str, image_name: str, v: str = None):
     try:
         directory_config = settings.watch_directories[int(dir_id)]
-        image_path = directory_config.output / image_name
-        if image_path.exists():
-            return FileResponse(image_path)
-        else:
-            raise HTTPException(status_code=404, detail="Image not found")
     except IndexError:
         raise HTTPException(status_code=400, detail="Invalid directory ID")
 
+    # Only serve files inside the output directory
+    image_path = directory_config.output / Path(image_name).name
+
+    # File checks and reads are blocking: keep them off the event loop
+    image = await run_in_threadpool(image_cache.get, image_path)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    # A URL with the current version of the image can be cached forever
+    immutable = image.version is not None and v == image.version
+    return image_response(request, image, immutable=immutable)
+
+
+def list_images(output_directory: Path) -> list:
+    images = []
+    for f in output_directory.iterdir():
+        try:
+            stat_result = f.stat()
+        except FileNotFoundError:
+            continue
+        if stat.S_ISREG(stat_result.st_mode):
+            images.append((f.name, file_version(stat_result)))
+    return sorted(images)
+
 
 @app.get("/image-list/{dir_id}")
 async def get_image_list(dir_id: str):
     try:
         directory_config = settings.watch_directories[int(dir_id)]
-        images = sorted([f for f in directory_config.output.iterdir() if f.is_file()])
-
-        if settings.dashboard.display_last_n_images > 0:
-            images = images[-settings.dashboard.display_last_n_images :]
-
-        images = reversed(images)
-        image_urls = [f"/images/{dir_id}/{image.name}" for image in images]
-        return {"image_urls": image_urls}
     except IndexError:
         raise HTTPException(status_code=400, detail="Invalid directory ID")
 
+    images = await run_in_threadpool(list_images, directory_config.output)
+
+    if settings.dashboard.display_last_n_images > 0:
+        images = images[-settings.dashboard.display_last_n_images :]
+
+    images = reversed(images)
+    image_urls = [f"/images/{dir_id}/{name}?v={version}" for name, version in images]
+    return {"image_urls": image_urls}
+
+
+@app.get("/image-cache")
+def get_image_cache_status():
+    return image_cache.get_status()
+
 
 @app.get("/process-status/{dir_id}")
 def process_status(dir_id: int):
@@ -97,6 +151,42 @@ def process_status(dir_id: int):
         raise HTTPException(status_code=400, detail="Invalid directory ID")
 
 
+@app.get("/timelapse/{dir_id}")
+def get_timelapse_list(dir_id: int):
+    try:
+        handler = image_handlers[dir_id]
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Invalid directory ID")
+    if not handler.timelapse:
+        raise HTTPException(status_code=404, detail="Time-lapse not enabled")
+
+    days = handler.timelapse.list_days()
+    return {
+        "days": {
+            day: {
+                key: [f"/timelapse/{dir_id}/{name}" for name in names]
+                for key, names in files.items()
+            }
+            for day, files in sorted(days.items(), reverse=True)
+        }
+    }
+
+
+@app.get("/timelapse/{dir_id}/{file_name}")
+def get_timelapse_file(dir_id: int, file_name: str):
+    try:
+        handler = image_handlers[dir_id]
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Invalid directory ID")
+    if not handler.timelapse:
+        raise HTTPException(status_code=404, detail="Time-lapse not enabled")
+
+    file_path = handler.timelapse.get_file(file_name)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(file_path)
+
+
 @app.get("/log")
 def read_log():
     try:
@@ -118,17 +208,33 @@ if __name__ == "__main__":
     start_all_observers()
 
     # Start Uvicorn server
-    server_thread = threading.Thread(
-        target=lambda: uvicorn.run(
-            app, host=settings.dashboard.host, port=settings.dashboard.port
-        )
+    server = uvicorn.Server(
+        uvicorn.Config(app, host=settings.dashboard.host, port=settings.dashboard.port)
     )
+    server_thread = threading.Thread(target=server.run)
     server_thread.start()
 
-    # Wait a moment to ensure the server is up before starting processing
-    time.sleep(2)
+    # Uvicorn only handles signals in the main thread: stop on SIGTERM (e.g.,
+    # docker stop) as on Ctrl+C
+    def handle_sigterm(signum, frame):
+        raise KeyboardInterrupt
 
-    # Process existing images if configured
-    if settings.proc.process_on_start:
-        for handler in image_handlers.values():
-            handler.process_existing_images()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    try:
+        # Wait a moment to ensure the server is up before starting processing
+        time.sleep(2)
+
+        # Process existing images if configured
+        if settings.proc.process_on_start:
+            for handler in image_handlers.values():
+                handler.process_existing_images()
+
+        while server_thread.is_alive():
+            server_thread.join(1)
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+    finally:
+        # The lifespan shutdown stops the observers and time-lapse builders
+        server.should_exit = True
+        server_thread.join()
@@ -0,0 +1,238 @@
+import logging
+import mimetypes
+import os
+import stat
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+
+logger = logging.getLogger()
+
+# Processed images are addressed by a versioned URL, so they can be cached
+# forever. Unversioned URLs must be revalidated with the ETag at every request.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+
+def file_version(stat_result: os.stat_result) -> str:
+    """Version of a file, changing whenever the file is rewritten."""
+    return f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+
+
+# Number of times a file changing while read is read again
+READ_ATTEMPTS = 3
+
+
+class CachedImage:
+    """Content and HTTP validators of an image file.
+
+    The content is None for files too large to be cached, which are streamed
+    from disk instead. Files that kept changing while read (i.e., being
+    rewritten) have no version, so that they are not cached by the clients.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        stat_result: os.stat_result,
+        content: Optional[bytes],
+        stable: bool = True,
+    ):
+        self.path = path
+        self.content = content
+        self.size = len(content) if content is not None else stat_result.st_size
+        self.version = file_version(stat_result) if stable else None
+        self.etag = f'"{self.version}"' if stable else None
+        self.last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.media_type = (
+            mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        )
+
+
+class ImageCache:
+    """Thread-safe LRU cache of the most recently served images.
+
+    Entries are keyed by path and validated against the file mtime and size at
+    every lookup, so an image rewritten by the FileHandler is never served
+    stale. The cache is bounded by the total size of the cached images.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024**2, max_item_bytes: int = None):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes or max_bytes // 8
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path: Path) -> Optional[CachedImage]:
+        """Return the image at path, or None if it is not a file.
+
+        This does blocking file I/O and must be run in a worker thread.
+        """
+        path = Path(path)
+        try:
+            stat_result = path.stat()
+        except OSError:
+            return None
+        if not stat.S_ISREG(stat_result.st_mode):
+            return None
+
+        key = str(path)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.version == file_version(stat_result):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        for _ in range(READ_ATTEMPTS):
+            if stat_result.st_size > self.max_item_bytes:
+                return CachedImage(path, stat_result, None)
+
+            try:
+                content = path.read_bytes()
+                new_stat_result = path.stat()
+            except OSError:
+                # The file was removed (e.g., remove_on_delete) after the stat
+                return None
+
+            # The content is consistent only if the file did not change while read
+            unchanged = file_version(new_stat_result) == file_version(stat_result)
+            if unchanged and len(content) == new_stat_result.st_size:
+                entry = CachedImage(path, stat_result, content)
+                self._put(key, entry)
+                return entry
+            stat_result = new_stat_result
+
+        # The file is being rewritten: serve what was read, without caching it
+        return CachedImage(path, stat_result, content, stable=False)
+
+    def _put(self, key: str, entry: CachedImage):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.size
+            self.entries[key] = entry
+            self.total_bytes += entry.size
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.size
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "cached_images": len(self.entries),
+                "cached_bytes": self.total_bytes,
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+            }
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range "bytes=" Range header.
+
+    Returns:
+        Tuple[int, int]: The first and last byte of the range (inclusive).
+        None: If the header is not a valid single byte range and should be
+            ignored, answering with the full content (RFC 9110, 14.2).
+
+    Raises:
+        ValueError: If the range cannot be satisfied.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        # Multiple ranges are allowed to be answered with the full content
+        return None
+
+    start, sep, end = ranges.strip().partition("-")
+    if not sep or not (start or end):
+        return None
+    if not (start or "0").isdigit() or not (end or "0").isdigit():
+        return None
+
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0 or size == 0:
+            raise ValueError(f"Unsatisfiable range: {range_header}")
+        return max(size - length, 0), size - 1
+
+    first = int(start)
+    last = int(end) if end else size - 1
+    if end and last < first:
+        # Syntactically invalid range: ignore it
+        return None
+    if first >= size:
+        raise ValueError(f"Unsatisfiable range: {range_header}")
+    return first, min(last, size - 1)
+
+
+def image_response(request: Request, image: CachedImage, immutable: bool = False):
+    """Build the response for an image, handling conditional and range requests."""
+    if image.etag is None:
+        # The image is being rewritten: do not let the clients cache it
+        headers = {"cache-control": "no-store", "accept-ranges": "bytes"}
+    else:
+        headers = {
+            "etag": image.etag,
+            "last-modified": image.last_modified,
+            "cache-control": IMMUTABLE_CACHE_CONTROL
+            if immutable
+            else REVALIDATE_CACHE_CONTROL,
+            "accept-ranges": "bytes",
+        }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and image.etag:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if image.etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+
+    if image.content is None:
+        # Too large to be cached: stream the file, letting FileResponse stat it
+        # again when sending and handle the ranges
+        del headers["accept-ranges"]
+        return FileResponse(image.path, headers=headers, media_type=image.media_type)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or (image.etag and if_range == image.etag)):
+        try:
+            byte_range = parse_range(range_header, image.size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**headers, "content-range": f"bytes */{image.size}"},
+            )
+        if byte_range is not None:
+            first, last = byte_range
+            headers["content-range"] = f"bytes {first}-{last}/{image.size}"
+            return Response(
+                content=image.content[first : last + 1],
+                status_code=206,
+                headers=headers,
+                media_type=image.media_type,
+            )
+
+    return Response(
+        content=image.content, headers=headers, media_type=image.media_type
+    )
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that lets browsers cache the files and revalidate them with
+    the ETag, instead of downloading them again at every dashboard refresh."""
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+        return response
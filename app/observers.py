@@ -3,6 +3,7 @@ from pathlib import Path
 
 from config import settings
 from process_image import process_image
+from timelapse import TimelapseBuilder
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
@@ -17,6 +18,7 @@ class FileHandler(FileSystemEventHandler):
         remove_on_delete: bool = True,
         skip_existing: bool = True,
         image_extensions: list = settings.proc.image_extensions,
+        timelapse: TimelapseBuilder = None,
         **kwargs,
     ):
         # Set the watch and output directories
@@ -50,12 +52,16 @@ class FileHandler(FileSystemEventHandler):
 
         self.opt = kwargs
 
+        # Optional builder of the daily time-lapse and contact sheet
+        self.timelapse = timelapse
+
         # Placeholder for the observer thread
         self.observer_thread = None
 
     def process_existing_images(self):
         logger.info("Processing existing images...")
-        for file_path in self.watch_directory.glob("*.*"):
+        # Sort the images so that they are appended to the time-lapse in order
+        for file_path in sorted(self.watch_directory.glob("*.*")):
             if self.skip_existing:
                 if self.image_map[str(file_path)]:
                     continue
@@ -117,7 +123,7 @@ class FileHandler(FileSystemEventHandler):
                 else:
                     self.opt["logo_path"] = None
 
-                resized_file_path = process_image(
+                resized_file_path, resized_img = process_image(
                     file_path,
                     self.output_directory,
                     w_max=1200,
@@ -125,12 +131,19 @@ class FileHandler(FileSystemEventHandler):
                     font_scale=10,
                     font_thickness=16,
                     left_border_percent=0.75,
+                    return_image=True,
                 )
 
                 self.image_map[str(file_path)] = str(resized_file_path)
                 self.processed_images += 1
                 logger.info(f"Resized image saved: {resized_file_path}")
 
+                # The image is passed in memory, as the file may be rewritten
+                # meanwhile. The builder waits for the image to settle and adds
+                # each path only once.
+                if self.timelapse:
+                    self.timelapse.add(file_path, resized_img)
+
             except Exception as e:
                 logger.error(f"Failed to process image {file_path}: {e}")
                 self.failed_images += 1
@@ -156,7 +169,7 @@ class FileHandler(FileSystemEventHandler):
             if self.observer_thread and self.observer_thread.is_alive()
             else "stopped."
         )
-        return {
+        status = {
             "status": thread_status,
             "watch_directory": str(self.watch_directory),
             "output_directory": str(self.output_directory),
@@ -165,6 +178,28 @@ class FileHandler(FileSystemEventHandler):
             "processed_images": self.processed_images,
             "failed_images": self.failed_images,
         }
+        if self.timelapse:
+            status.update(self.timelapse.get_status())
+        return status
+
+
+def start_timelapse(output_directory: Path) -> TimelapseBuilder:
+    if not settings.get("timelapse") or not settings.timelapse.enabled:
+        return None
+    return TimelapseBuilder(
+        output_directory=Path(output_directory) / settings.timelapse.directory,
+        fps=settings.timelapse.fps,
+        frame_width=settings.timelapse.frame_width,
+        tile_width=settings.timelapse.tile_width,
+        sheet_columns=settings.timelapse.sheet_columns,
+        sheet_rows=settings.timelapse.sheet_rows,
+        segment_frames=settings.timelapse.segment_frames,
+        max_open_days=settings.timelapse.max_open_days,
+        close_after=settings.timelapse.close_after,
+        queue_size=settings.timelapse.queue_size,
+        settle_time=settings.timelapse.settle_time,
+        flush_interval=settings.timelapse.flush_interval,
+    )
 
 
 def start_observer(watch_directory: Path, output_directory: Path = None):
@@ -176,6 +211,14 @@ def start_observer(watch_directory: Path, output_directory: Path = None):
         image_extensions=settings.proc.image_extensions,
         w_max=settings.proc.w_max,
     )
+
+    handler.timelapse = start_timelapse(handler.output_directory)
+    if handler.timelapse:
+        # Images processed in a previous run are not added again
+        handler.timelapse.mark_added(
+            file_path for file_path, output in handler.image_map.items() if output
+        )
+
     observer = Observer()
     observer.schedule(handler, str(watch_directory), recursive=settings.proc.recursive)
     observer.start()
@@ -213,3 +256,8 @@ if __name__ == "__main__":
 
         for observer, _ in observers_and_handlers:
             observer.join()
+
+        # Close the time-lapse videos being written
+        for _, handler in observers_and_handlers:
+            if handler.timelapse:
+                handler.timelapse.stop()
@@ -211,7 +211,8 @@ def process_image(
     font_color: Tuple[int, int, int] = (255, 255, 255),
     font: int = cv2.FONT_HERSHEY_SIMPLEX,
     logo_path: Optional[str] = None,
-) -> Path:
+    return_image: bool = False,
+) -> Union[Path, Tuple[Path, np.ndarray]]:
     """Process an image by adding a string overlay, logo, and resizing it.
 
     Args:
@@ -225,9 +226,11 @@ def process_image(
         font_color (Tuple[int, int, int], optional): Color of the text overlay in BGR format. Defaults to (255, 255, 255).
         font (int, optional): Font type for the text overlay. Defaults to cv2.FONT_HERSHEY_SIMPLEX.
         logo_path (Optional[str], optional): Path to the logo image file. Defaults to None.
+        return_image (bool, optional): Also return the processed image. Defaults to False.
 
     Returns:
         Path: Path to the processed image file.
+        Tuple[Path, np.ndarray]: Path to the processed image file and the processed image, if return_image is True.
     """
     # Check if the image exists
     if not file_path.exists():
@@ -262,6 +265,8 @@ def process_image(
     out_path = output_directory / file_path.name
     cv2.imwrite(str(out_path), resized_img)
 
+    if return_image:
+        return out_path, resized_img
     return out_path
 
 
@@ -0,0 +1,416 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import cv2
+import numpy as np
+from process_image import read_date_from_exif, resize_image
+
+logger = logging.getLogger()
+
+VIDEO_PREFIX = "timelapse"
+SHEET_PREFIX = "contact"
+VIDEO_SUFFIX = ".avi"
+SHEET_SUFFIX = ".jpg"
+
+
+class DailySegment:
+    """Time-lapse video and contact sheet being built for a single day.
+
+    Frames are appended to an open cv2.VideoWriter and pasted into a
+    preallocated contact-sheet canvas, so memory usage is bounded by the sheet
+    size and never grows with the number of images of the day.
+    """
+
+    def __init__(
+        self,
+        output_directory: Path,
+        day: str,
+        fps: int = 10,
+        frame_width: int = 1200,
+        tile_width: int = 240,
+        sheet_columns: int = 8,
+        sheet_rows: int = 8,
+        segment_frames: int = 100,
+    ):
+        self.output_directory = Path(output_directory)
+        self.day = day
+        self.fps = fps
+        self.frame_width = frame_width
+        self.tile_width = tile_width
+        self.sheet_columns = sheet_columns
+        self.sheet_rows = sheet_rows
+        self.segment_frames = segment_frames
+
+        # Never overwrite what was built by a previous run: if the day already
+        # has files (e.g., after a restart), continue on a new segment/page.
+        self.video_index = self._next_index(VIDEO_PREFIX, VIDEO_SUFFIX)
+        self.sheet_index = self._next_index(SHEET_PREFIX, SHEET_SUFFIX)
+
+        self.writer = None
+        self.frame_size = None
+        self.frame_count = 0
+
+        self.sheet = None
+        self.tile_size = None
+        self.tile_count = 0
+        self.sheet_dirty = False
+
+        # Time of the last image added, to close the segments no longer updated
+        self.last_update = time.monotonic()
+
+    def _file_name(self, prefix: str, index: int, suffix: str) -> str:
+        return f"{prefix}_{self.day}_{index:02}{suffix}"
+
+    def _next_index(self, prefix: str, suffix: str) -> int:
+        existing = self.output_directory.glob(f"{prefix}_{self.day}_*{suffix}")
+        return len(list(existing))
+
+    @property
+    def video_path(self) -> Path:
+        return self.output_directory / self._file_name(
+            VIDEO_PREFIX, self.video_index, VIDEO_SUFFIX
+        )
+
+    @property
+    def sheet_path(self) -> Path:
+        return self.output_directory / self._file_name(
+            SHEET_PREFIX, self.sheet_index, SHEET_SUFFIX
+        )
+
+    @property
+    def recording_video_path(self) -> Optional[Path]:
+        """Path of the video being written, which is not playable until released."""
+        return self.video_path if self.writer is not None else None
+
+    def add(self, image: np.ndarray):
+        self._add_frame(image)
+        self._add_tile(image)
+        self.last_update = time.monotonic()
+
+    def _add_frame(self, image: np.ndarray):
+        if self.writer is None:
+            frame = resize_image(image, width=self.frame_width)
+            self.frame_size = (frame.shape[1], frame.shape[0])
+            self.writer = cv2.VideoWriter(
+                str(self.video_path),
+                cv2.VideoWriter_fourcc(*"MJPG"),
+                self.fps,
+                self.frame_size,
+            )
+            if not self.writer.isOpened():
+                self.writer = None
+                raise RuntimeError(
+                    f"Unable to open video writer: {self.video_path}"
+                )
+            logger.info(f"Started time-lapse video: {self.video_path}")
+        else:
+            # All the frames of a video must have the same size
+            frame = resize_image(image, *self.frame_size)
+        self.writer.write(frame)
+        self.frame_count += 1
+
+        # The AVI index is only written on release: finalize the video every
+        # segment_frames frames, so that the day can be served while recorded.
+        if self.frame_count >= self.segment_frames:
+            self._release_video()
+            self.video_index += 1
+
+    def _release_video(self):
+        if self.writer is None:
+            return
+        self.writer.release()
+        self.writer = None
+        logger.info(
+            f"Closed time-lapse video: {self.video_path} ({self.frame_count} frames)"
+        )
+        self.frame_count = 0
+
+    def _add_tile(self, image: np.ndarray):
+        if self.sheet is None:
+            tile = resize_image(image, width=self.tile_width)
+            self.tile_size = (tile.shape[1], tile.shape[0])
+            self.sheet = np.zeros(
+                (
+                    self.tile_size[1] * self.sheet_rows,
+                    self.tile_size[0] * self.sheet_columns,
+                    3,
+                ),
+                dtype=np.uint8,
+            )
+            self.tile_count = 0
+        else:
+            tile = resize_image(image, *self.tile_size)
+
+        w, h = self.tile_size
+        row, col = divmod(self.tile_count, self.sheet_columns)
+        self.sheet[row * h : (row + 1) * h, col * w : (col + 1) * w] = tile
+        self.tile_count += 1
+        self.sheet_dirty = True
+
+        # When the page is full, write it and start a new one
+        if self.tile_count >= self.sheet_columns * self.sheet_rows:
+            self.flush()
+            self.sheet = None
+            self.sheet_index += 1
+
+    def flush(self):
+        if self.sheet is None or not self.sheet_dirty:
+            return
+
+        # Only keep the rows that contain at least one tile
+        used_rows = -(-self.tile_count // self.sheet_columns)
+        sheet = self.sheet[: used_rows * self.tile_size[1]]
+
+        # Write to a temporary file and rename it, so that the dashboard never
+        # serves a partially written image.
+        tmp_path = self.sheet_path.with_name(f".{self.sheet_path.name}")
+        if not cv2.imwrite(str(tmp_path), sheet):
+            raise OSError(f"Unable to write contact sheet: {tmp_path}")
+        os.replace(tmp_path, self.sheet_path)
+        self.sheet_dirty = False
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._release_video()
+
+
+class TimelapseBuilder:
+    """Background builder of per-day time-lapse videos and contact sheets.
+
+    Processed images are passed by the FileHandler and appended by a worker
+    thread to the video and contact sheet of the day they were taken, without
+    re-reading the images already added. An image is appended only once it has
+    not been processed again for settle_time seconds, so that files still being
+    uploaded (processed at each modification) are added once and complete.
+
+    A few days are kept open at the same time, so that images of different
+    days arriving interleaved (e.g., the backlog of a remote camera) do not
+    split the videos into many fragments.
+    """
+
+    # Max number of paths remembered to avoid adding an image twice
+    max_added_paths = 100000
+
+    def __init__(
+        self,
+        output_directory: Path,
+        fps: int = 10,
+        frame_width: int = 1200,
+        tile_width: int = 240,
+        sheet_columns: int = 8,
+        sheet_rows: int = 8,
+        segment_frames: int = 100,
+        max_open_days: int = 3,
+        close_after: float = 600.0,
+        queue_size: int = 16,
+        settle_time: float = 5.0,
+        flush_interval: float = 5.0,
+    ):
+        self.output_directory = Path(output_directory)
+        self.output_directory.mkdir(parents=True, exist_ok=True)
+        self.segment_opt = dict(
+            fps=fps,
+            frame_width=frame_width,
+            tile_width=tile_width,
+            sheet_columns=sheet_columns,
+            sheet_rows=sheet_rows,
+            segment_frames=segment_frames,
+        )
+        self.max_open_days = max_open_days
+        self.close_after = close_after
+        self.queue_size = queue_size
+        self.settle_time = settle_time
+        self.flush_interval = flush_interval
+
+        # Images waiting to settle, by path: (image, time of the last update).
+        # Bounded: if the builder falls behind, new images are dropped rather
+        # than blocking the FileHandler.
+        self.pending = {}
+        # Paths already added to the time-lapse
+        self.added = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.segments = {}
+        self.segments_lock = threading.Lock()
+        self.added_images = 0
+        self.failed_images = 0
+        self.dropped_images = 0
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, file_path: Union[Path, str], image: np.ndarray):
+        """Schedule a processed image to be appended to the time-lapse of its day.
+
+        If the same path is added again before it settles, the latest image
+        replaces the previous one. Paths already appended are ignored.
+        """
+        key = str(file_path)
+        with self.lock:
+            if key in self.added:
+                return
+            if key not in self.pending and len(self.pending) >= self.queue_size:
+                logger.warning(f"Time-lapse queue full, dropping image {file_path}")
+                self.dropped_images += 1
+                return
+            self.pending[key] = (image, time.monotonic())
+
+    def mark_added(self, file_paths):
+        """Mark images as already added, e.g. those processed in a previous run."""
+        with self.lock:
+            for file_path in file_paths:
+                self._mark_added(str(file_path))
+
+    def _mark_added(self, key: str):
+        self.added[key] = None
+        self.added.move_to_end(key)
+        while len(self.added) > self.max_added_paths:
+            self.added.popitem(last=False)
+
+    def stop(self, timeout: float = None):
+        """Stop the worker, adding the pending images and writing the open
+        contact sheets and videos to disk."""
+        self.stop_event.set()
+        self.thread.join(timeout)
+
+    def _run(self):
+        tick = min(self.settle_time, self.flush_interval, 1.0)
+        last_flush = time.monotonic()
+        while not self.stop_event.wait(tick):
+            self._append_settled()
+
+            # Write the contact sheets and close old days on a timer, also
+            # while images keep arriving
+            if time.monotonic() - last_flush >= self.flush_interval:
+                last_flush = time.monotonic()
+                try:
+                    self._flush()
+                except Exception as e:
+                    logger.error(f"Failed to write time-lapse files: {e}")
+
+        self._append_settled(force=True)
+        for day in list(self.segments):
+            self._close(day)
+
+    def _append_settled(self, force: bool = False):
+        now = time.monotonic()
+        with self.lock:
+            settled = sorted(
+                key
+                for key, (_, updated) in self.pending.items()
+                if force or now - updated >= self.settle_time
+            )
+            items = []
+            for key in settled:
+                items.append((key, self.pending.pop(key)[0]))
+                self._mark_added(key)
+
+        for key, image in items:
+            try:
+                self._append(Path(key), image)
+                self.added_images += 1
+            except Exception as e:
+                logger.error(f"Failed to add image {key} to time-lapse: {e}")
+                self.failed_images += 1
+
+    def _append(self, file_path: Path, image: np.ndarray):
+        day = self._get_day(file_path)
+        if day not in self.segments:
+            segment = DailySegment(self.output_directory, day, **self.segment_opt)
+            with self.segments_lock:
+                self.segments[day] = segment
+
+            # Keep at most max_open_days open, closing the oldest days first
+            while len(self.segments) > self.max_open_days:
+                self._close(min(d for d in self.segments if d != day))
+
+        self.segments[day].add(image)
+
+    def _flush(self):
+        newest_day = max(self.segments, default=None)
+        for day, segment in list(self.segments.items()):
+            # The newest day stays open, older days are closed once no longer
+            # updated
+            if (
+                day != newest_day
+                and time.monotonic() - segment.last_update > self.close_after
+            ):
+                self._close(day)
+            else:
+                segment.flush()
+
+    def _close(self, day: str):
+        with self.segments_lock:
+            segment = self.segments.pop(day)
+        try:
+            segment.close()
+        except Exception as e:
+            logger.error(f"Failed to close time-lapse of day {day}: {e}")
+
+    @staticmethod
+    def _get_day(file_path: Path) -> str:
+        # The resized image has no EXIF, so read the date from the original
+        date_time = None
+        if file_path.exists():
+            try:
+                date_time = read_date_from_exif(file_path)
+            except Exception:
+                date_time = None
+        if date_time is None:
+            date_time = datetime.now()
+        return date_time.strftime("%Y%m%d")
+
+    def _recording_files(self) -> set:
+        with self.segments_lock:
+            paths = [s.recording_video_path for s in self.segments.values()]
+        return {path.name for path in paths if path is not None}
+
+    def list_days(self) -> Dict[str, Dict[str, List[str]]]:
+        """Return the video and contact sheet files available for each day.
+
+        Videos still being recorded are not listed, as they are not playable.
+        """
+        recording = self._recording_files()
+        days = {}
+        for prefix, key, suffix in (
+            (VIDEO_PREFIX, "videos", VIDEO_SUFFIX),
+            (SHEET_PREFIX, "contact_sheets", SHEET_SUFFIX),
+        ):
+            for path in sorted(self.output_directory.glob(f"{prefix}_*{suffix}")):
+                if path.name in recording:
+                    continue
+                day = path.stem.split("_")[1]
+                days.setdefault(day, {"videos": [], "contact_sheets": []})
+                days[day][key].append(path.name)
+        return days
+
+    def get_file(self, file_name: str) -> Optional[Path]:
+        """Return the path of a time-lapse file, or None if it does not exist or
+        is still being recorded."""
+        path = self.output_directory / Path(file_name).name
+        if path.suffix not in (VIDEO_SUFFIX, SHEET_SUFFIX) or not path.is_file():
+            return None
+        if path.name in self._recording_files():
+            return None
+        return path
+
+    def get_status(self):
+        with self.segments_lock:
+            open_days = sorted(self.segments)
+        return {
+            "timelapse_directory": str(self.output_directory),
+            "open_days": open_days,
+            "queued_images": len(self.pending),
+            "timelapse_images": self.added_images,
+            "timelapse_failed_images": self.failed_images,
+            "timelapse_dropped_images": self.dropped_images,
+        }
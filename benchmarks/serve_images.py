@@ -0,0 +1,82 @@
+"""Throughput benchmark of the processed images served by the dashboard.
+
+Simulates concurrent dashboard clients downloading the images listed by
+/image-list/{dir_id}, either always downloading the full content or
+revalidating it with the ETag (as browsers do for cached images).
+
+Usage (with the app running):
+    python benchmarks/serve_images.py --url http://localhost:9500 --clients 16
+"""
+
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+
+def fetch(url: str, etag: str = None):
+    request = urllib.request.Request(url)
+    if etag:
+        request.add_header("If-None-Match", etag)
+    try:
+        with urllib.request.urlopen(request) as response:
+            content = response.read()
+            return response.status, len(content), response.headers.get("etag")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return 304, 0, etag
+        raise
+
+
+def run_client(urls: List[str], requests: int, revalidate: bool):
+    etags = {}
+    n_bytes = 0
+    for i in range(requests):
+        url = urls[i % len(urls)]
+        _, size, etag = fetch(url, etags.get(url) if revalidate else None)
+        etags[url] = etag
+        n_bytes += size
+    return n_bytes
+
+
+def benchmark(urls: List[str], clients: int, requests: int, revalidate: bool):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        futures = [
+            executor.submit(run_client, urls, requests, revalidate)
+            for _ in range(clients)
+        ]
+        n_bytes = sum(f.result() for f in futures)
+    elapsed = time.perf_counter() - start
+
+    n_requests = clients * requests
+    mode = "revalidate (ETag)" if revalidate else "full download"
+    print(
+        f"{mode:>18}: {n_requests} requests in {elapsed:.2f}s - "
+        f"{n_requests / elapsed:.1f} req/s, {n_bytes / elapsed / 1024**2:.1f} MB/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:9500")
+    parser.add_argument("--dir-id", type=int, default=0)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+
+    with urllib.request.urlopen(f"{args.url}/image-list/{args.dir_id}") as response:
+        image_urls = json.load(response)["image_urls"]
+    if not image_urls:
+        raise SystemExit(f"No images found in directory {args.dir_id}")
+    urls = [f"{args.url}{url}" for url in image_urls]
+
+    print(f"Serving {len(urls)} images to {args.clients} concurrent clients")
+    for revalidate in (False, True):
+        benchmark(urls, args.clients, args.requests, revalidate)
+
+    with urllib.request.urlopen(f"{args.url}/image-cache") as response:
+        print(f"Image cache: {response.read().decode()}")
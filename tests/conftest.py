@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app modules are imported as top-level modules, as when running `python app`
+sys.path.insert(0, str(Path(__file__).parents[1] / "app"))
@@ -0,0 +1,208 @@
+import os
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from image_cache import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    ImageCache,
+    image_response,
+    parse_range,
+)
+
+
+def write_file(path: Path, size: int, mtime_ns: int = None) -> Path:
+    path.write_bytes(bytes(i % 256 for i in range(size)))
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+@pytest.mark.parametrize(
+    "header, size, expected",
+    [
+        ("bytes=0-9", 100, (0, 9)),
+        ("bytes=90-", 100, (90, 99)),
+        ("bytes=95-200", 100, (95, 99)),
+        ("bytes=-10", 100, (90, 99)),
+        ("bytes=-200", 100, (0, 99)),
+        # Invalid or unsupported ranges are ignored
+        ("bytes=5-3", 100, None),
+        ("bytes=x-3", 100, None),
+        ("bytes=-", 100, None),
+        ("bytes=0-1,5-6", 100, None),
+        ("items=0-1", 100, None),
+    ],
+)
+def test_parse_range(header, size, expected):
+    assert parse_range(header, size) == expected
+
+
+@pytest.mark.parametrize(
+    "header, size",
+    [("bytes=100-", 100), ("bytes=-0", 100), ("bytes=-5", 0), ("bytes=0-", 0)],
+)
+def test_parse_range_unsatisfiable(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
+
+
+def test_cache_lru_byte_accounting(tmp_path):
+    cache = ImageCache(max_bytes=250, max_item_bytes=200)
+    paths = [write_file(tmp_path / f"{i}.jpg", 100) for i in range(3)]
+
+    cache.get(paths[0])
+    cache.get(paths[1])
+    assert cache.get_status()["cached_bytes"] == 200
+
+    # The least recently used image is evicted
+    cache.get(paths[0])
+    cache.get(paths[2])
+    status = cache.get_status()
+    assert list(cache.entries) == [str(paths[0]), str(paths[2])]
+    assert status["cached_bytes"] == 200
+    assert status["cache_hits"] == 1
+    assert status["cache_misses"] == 3
+
+    # A rewritten image replaces its entry
+    write_file(paths[2], 50, mtime_ns=1)
+    assert cache.get(paths[2]).size == 50
+    assert cache.get_status()["cached_bytes"] == 150
+
+
+def test_cache_does_not_keep_large_images(tmp_path):
+    cache = ImageCache(max_bytes=1000, max_item_bytes=100)
+    image = cache.get(write_file(tmp_path / "big.jpg", 500))
+    assert image.content is None
+    assert image.etag is not None
+    assert cache.get_status()["cached_images"] == 0
+
+
+def test_cache_missing_images(tmp_path):
+    cache = ImageCache()
+    assert cache.get(tmp_path / "missing.jpg") is None
+    assert cache.get(tmp_path) is None
+
+
+def test_cache_image_changing_while_read(tmp_path, monkeypatch):
+    cache = ImageCache()
+    path = write_file(tmp_path / "a.jpg", 100)
+
+    # Simulate a file growing at every read
+    sizes = iter(range(101, 200))
+
+    def read_bytes(self):
+        write_file(self, next(sizes))
+        return b"partial"
+
+    monkeypatch.setattr(Path, "read_bytes", read_bytes)
+    image = cache.get(path)
+    assert image.content == b"partial"
+    assert image.etag is None
+    assert image.version is None
+    assert cache.get_status()["cached_images"] == 0
+
+
+@pytest.fixture
+def client(tmp_path):
+    cache = ImageCache(max_bytes=10000, max_item_bytes=1000)
+    app = FastAPI()
+
+    @app.get("/images/{name}")
+    def get_image(request: Request, name: str, v: str = None):
+        image = cache.get(tmp_path / name)
+        if image is None:
+            raise HTTPException(status_code=404)
+        immutable = image.version is not None and v == image.version
+        return image_response(request, image, immutable=immutable)
+
+    write_file(tmp_path / "a.jpg", 100)
+    write_file(tmp_path / "big.jpg", 5000)
+    write_file(tmp_path / "empty.jpg", 0)
+    return TestClient(app)
+
+
+def test_image_response(client):
+    response = client.get("/images/a.jpg")
+    assert response.status_code == 200
+    assert len(response.content) == 100
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+    assert response.headers["accept-ranges"] == "bytes"
+    assert "last-modified" in response.headers
+
+    etag = response.headers["etag"]
+    response = client.get("/images/a.jpg", headers={"if-none-match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    assert client.get("/images/missing.jpg").status_code == 404
+
+
+def test_image_response_immutable(client):
+    response = client.get("/images/a.jpg")
+    version = response.headers["etag"].strip('"')
+    response = client.get(f"/images/a.jpg?v={version}")
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+    response = client.get("/images/a.jpg?v=old")
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+
+
+def test_image_response_ranges(client):
+    response = client.get("/images/a.jpg", headers={"range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 10-19/100"
+    assert response.content == bytes(range(10, 20))
+
+    response = client.get("/images/a.jpg", headers={"range": "bytes=5-3"})
+    assert response.status_code == 200
+    assert len(response.content) == 100
+
+    response = client.get("/images/a.jpg", headers={"range": "bytes=100-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */100"
+
+    response = client.get("/images/empty.jpg", headers={"range": "bytes=-5"})
+    assert response.status_code == 416
+
+
+def test_image_response_if_range(client):
+    etag = client.get("/images/a.jpg").headers["etag"]
+
+    headers = {"range": "bytes=0-9", "if-range": etag}
+    assert client.get("/images/a.jpg", headers=headers).status_code == 206
+
+    # The image changed: the full content is sent
+    headers = {"range": "bytes=0-9", "if-range": '"old"'}
+    response = client.get("/images/a.jpg", headers=headers)
+    assert response.status_code == 200
+    assert len(response.content) == 100
+
+
+def test_image_response_large_image(client):
+    response = client.get("/images/big.jpg")
+    assert response.status_code == 200
+    assert len(response.content) == 5000
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+
+    etag = response.headers["etag"]
+    response = client.get("/images/big.jpg", headers={"if-none-match": etag})
+    assert response.status_code == 304
+
+
+def test_image_response_image_changing_while_read(client, tmp_path, monkeypatch):
+    sizes = iter(range(101, 200))
+
+    def read_bytes(self):
+        write_file(self, next(sizes))
+        return b"partial"
+
+    monkeypatch.setattr(Path, "read_bytes", read_bytes)
+    response = client.get("/images/a.jpg?v=anything")
+    assert response.status_code == 200
+    assert response.content == b"partial"
+    assert response.headers["cache-control"] == "no-store"
+    assert "etag" not in response.headers
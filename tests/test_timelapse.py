@@ -0,0 +1,114 @@
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+from timelapse import TimelapseBuilder
+
+
+def make_image(value: int) -> np.ndarray:
+    return np.full((40, 60, 3), value, dtype=np.uint8)
+
+
+@pytest.fixture
+def builder_factory(tmp_path, monkeypatch):
+    # Images are named "<day>_<n>.jpg", so that the day does not come from EXIF
+    monkeypatch.setattr(
+        TimelapseBuilder, "_get_day", staticmethod(lambda p: p.stem.split("_")[0])
+    )
+    builders = []
+
+    def factory(**kwargs):
+        opt = dict(frame_width=60, tile_width=20, settle_time=0.1, flush_interval=0.1)
+        opt.update(kwargs)
+        builder = TimelapseBuilder(tmp_path / "timelapse", **opt)
+        builders.append(builder)
+        return builder
+
+    yield factory
+    for builder in builders:
+        builder.stop()
+
+
+@pytest.mark.parametrize("max_open_days, n_days", [(3, 3), (4, 3), (5, 4), (2, 5)])
+def test_open_days_eviction(builder_factory, max_open_days, n_days):
+    # Long intervals: the worker never runs while appending directly
+    builder = builder_factory(
+        max_open_days=max_open_days, settle_time=60, flush_interval=60
+    )
+    days = [f"2026010{i}" for i in range(1, n_days + 1)]
+    for day in days:
+        builder._append(Path(f"{day}_0.jpg"), make_image(0))
+
+    assert sorted(builder.segments) == days[-max_open_days:]
+
+
+def test_interleaved_days_are_not_fragmented(builder_factory):
+    builder = builder_factory(max_open_days=2, settle_time=60, flush_interval=60)
+    for i in range(6):
+        builder._append(Path(f"2026010{1 + i % 2}_{i}.jpg"), make_image(0))
+    builder.stop()
+
+    videos = sorted(p.name for p in builder.output_directory.glob("*.avi"))
+    assert videos == ["timelapse_20260101_00.avi", "timelapse_20260102_00.avi"]
+
+
+def test_add_waits_for_image_to_settle(builder_factory):
+    builder = builder_factory(settle_time=0.3)
+    # A partial upload processed on creation is replaced by the complete image
+    builder.add("20260101_0.jpg", make_image(50))
+    builder.add("20260101_0.jpg", make_image(200))
+    assert builder.added_images == 0
+
+    time.sleep(1.0)
+    assert builder.added_images == 1
+
+    # Later events of the same path are ignored
+    builder.add("20260101_0.jpg", make_image(100))
+    builder.stop()
+    assert builder.added_images == 1
+
+    sheet = cv2.imread(str(builder.output_directory / "contact_20260101_00.jpg"))
+    # The first tile holds the latest image
+    assert abs(int(sheet[5, 5, 0]) - 200) < 5
+
+
+def test_mark_added_skips_images(builder_factory):
+    builder = builder_factory()
+    builder.mark_added(["20260101_0.jpg"])
+    builder.add("20260101_0.jpg", make_image(0))
+    builder.stop()
+    assert builder.added_images == 0
+
+
+def test_add_drops_images_when_full(builder_factory):
+    builder = builder_factory(queue_size=2, settle_time=60)
+    for i in range(4):
+        builder.add(f"20260101_{i}.jpg", make_image(0))
+    assert builder.dropped_images == 2
+
+    builder.stop()
+    assert builder.added_images == 2
+
+
+def test_contact_sheet_flushed_while_images_arrive(builder_factory):
+    builder = builder_factory(settle_time=0.05, flush_interval=0.2)
+    sheet_path = builder.output_directory / "contact_20260101_00.jpg"
+    # A steady stream of images, never leaving the worker idle
+    for i in range(10):
+        builder.add(f"20260101_{i}.jpg", make_image(0))
+        time.sleep(0.1)
+    assert sheet_path.exists()
+
+
+def test_recording_video_not_listed(builder_factory):
+    builder = builder_factory(segment_frames=2, settle_time=60, flush_interval=60)
+    for i in range(3):
+        builder._append(Path(f"20260101_{i}.jpg"), make_image(0))
+
+    # The first segment is finalized, the second one is being recorded
+    days = builder.list_days()
+    assert days["20260101"]["videos"] == ["timelapse_20260101_00.avi"]
+    assert builder.get_file("timelapse_20260101_01.avi") is None
+    assert builder.get_file("timelapse_20260101_00.avi") is not None